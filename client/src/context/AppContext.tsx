@@ -32,58 +32,59 @@ export default function AppProvider({ children }: { children: ReactNode }) {
     
     try {
       // Load chunks in batches
-      let chunkStart = 0;
-      const chunkBatchSize = 10;
-      
-      while (chunkStart < totalChunks) {
-        const response = await fetch(
-          `${backend_url}/session/${sessionId}/chunks?start=${chunkStart}&limit=${chunkBatchSize}`
-        );
+      const loadChunks = async () => {
+        let chunkStart = 0;
+        const chunkBatchSize = 100;
         
-        if (!response.ok) {
-          throw new Error('Error loading chunks');
+        while (chunkStart < totalChunks) {
+          const response = await fetch(
+            `${backend_url}/session/${sessionId}/chunks?start=${chunkStart}&limit=${chunkBatchSize}`
+          );
+          
+          if (!response.ok) {
+            throw new Error('Error loading chunks');
+          }
+          
+          const chunkBatch = await response.json();
+          audioChunks.current.push(...chunkBatch.chunks);
+          
+          setLoadingProgress(prev => ({
+            ...prev,
+            chunks: audioChunks.current.length
+          }));
+          
+          chunkStart += chunkBatchSize;
         }
-        
-        const chunkBatch = await response.json();
-        audioChunks.current.push(...chunkBatch.chunks);
-        
-        setLoadingProgress(prev => ({
-          ...prev,
-          chunks: audioChunks.current.length
-        }));
-        
-        chunkStart += chunkBatchSize;
-        
-        // Small delay to prevent overwhelming the server
-        await new Promise(resolve => setTimeout(resolve, 10));
-      }
+      };
       
       // Load analysis in batches
-      let analysisStart = 0;
-      const analysisBatchSize = 50;
-      
-      while (analysisStart < totalAnalysis) {
-        const response = await fetch(
-          `${backend_url}/session/${sessionId}/analysis?start=${analysisStart}&limit=${analysisBatchSize}`
-        );
+      const loadAnalysis = async () => {
+        let analysisStart = 0;
+        const analysisBatchSize = 50;
         
-        if (!response.ok) {
-          throw new Error('Error loading analysis');
+        while (analysisStart < totalAnalysis) {
+          const response = await fetch(
+            `${backend_url}/session/${sessionId}/analysis?start=${analysisStart}&limit=${analysisBatchSize}`
+          );
+          
+          if (!response.ok) {
+            throw new Error('Error loading analysis');
+          }
+          
+          const analysisBatch = await response.json();
+          audioAnalysis.current.push(...analysisBatch.analysis);
+          
+          setLoadingProgress(prev => ({
+            ...prev,
+            analysis: audioAnalysis.current.length
+          }));
+          
+          analysisStart += analysisBatchSize;
         }
-        
-        const analysisBatch = await response.json();
-        audioAnalysis.current.push(...analysisBatch.analysis);
-        
-        setLoadingProgress(prev => ({
-          ...prev,
-          analysis: audioAnalysis.current.length
-        }));
-        
-        analysisStart += analysisBatchSize;
-        
-        // Small delay to prevent overwhelming the server
-        await new Promise(resolve => setTimeout(resolve, 10));
-      }
+      };
+      
+      // Both streams are independent, so they are fetched concurrently
+      await Promise.all([loadChunks(), loadAnalysis()]);
       
       // Mark loading as complete
       setLoadingProgress(prev => ({ ...prev, isComplete: true }));
@@ -1,28 +1,79 @@
-from fastapi import FastAPI, UploadFile, File, status
+from fastapi import FastAPI, UploadFile, File, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, Response
+from fastapi.responses import FileResponse, ORJSONResponse, Response
+import aiofiles
+import asyncio
+import hashlib
+import multiprocessing
+import msgpack
+import orjson
 import os
+import shutil
+import time
 import uuid
-from services.audio_processor import AudioProcessor
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from services.audio_processor import AudioProcessor, AudioTooLongError
 from services.audio_analyzer import AudioAnalyzer
 from models.models import (
-    AudioChunkData,
-    AudioAnalysisMessage
+    AudioChunkArrays,
+    AudioRelationships,
+    AudioFileInfo
 )
-from typing import List, Dict
+from typing import Any, List, Dict, Optional, Tuple
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Tarea de fondo que desaloja las sesiones inactivas durante toda la vida del servidor
+    reaper = asyncio.create_task(reap_sessions())
+    yield
+    reaper.cancel()
+    # Terminar los procesos del pool (y descartar el trabajo pendiente) al apagar el servidor
+    executor.shutdown(wait=True, cancel_futures=True)
+
+# orjson serializa las respuestas JSON (chunks y análisis) mucho más rápido que json estándar
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+
+# Tamaño máximo de un archivo subido (un MP3 de 320 kbps de unos 17 minutos). Además, el
+# procesador rechaza audios de más de MAX_AUDIO_DURATION_SECONDS (un MP3 de poco bitrate
+# puede durar mucho más en el mismo tamaño)
+MAX_UPLOAD_BYTES = 40 * 1024 * 1024
+UPLOAD_TOO_LARGE_ERROR = {"error": f"El archivo supera el tamaño máximo de {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"}
+
+class UploadSizeLimitMiddleware:
+    """Rechaza con 413 las peticiones cuyo Content-Length supera MAX_UPLOAD_BYTES, antes de leer el cuerpo"""
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            content_length = dict(scope["headers"]).get(b"content-length", b"")
+            if content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+                response = ORJSONResponse(UPLOAD_TOO_LARGE_ERROR, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+# Se añade antes que CORS para que la respuesta 413 también lleve las cabeceras CORS
+app.add_middleware(UploadSizeLimitMiddleware)
+
+# Permitir CORS para el frontend en desarrollo.
+# Los navegadores envían el Origin sin barra final: se normaliza una sola vez y se guarda
+# en un conjunto para que la comprobación de cada preflight sea O(1)
+ALLOWED_ORIGINS = frozenset(origin.rstrip("/") for origin in [
+    "http://localhost:5173",
+    "https://synchro-nice.vercel.app/",
+    "https://vercel.com/fabio-quevedos-projects/synchro-nice/46dWfCamhEtyM2BWA4k1vQMhFFTL",
+    "https://synchro-nice-fabio-quevedos-projects.vercel.app/",
+    "https://synchro-nice-git-master-fabio-quevedos-projects.vercel.app/",
+])
 
-# Permitir CORS para el frontend en desarrollo
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
-        "http://localhost:5173",
-        "https://synchro-nice.vercel.app/",
-        "https://vercel.com/fabio-quevedos-projects/synchro-nice/46dWfCamhEtyM2BWA4k1vQMhFFTL",
-        "https://synchro-nice-fabio-quevedos-projects.vercel.app/",
-        "https://synchro-nice-git-master-fabio-quevedos-projects.vercel.app/",
-        ],
+    allow_origins=ALLOWED_ORIGINS,
     allow_methods=["*"],
     allow_headers=["*"],
 )
@@ -30,14 +81,326 @@ app.add_middleware(
 # Instancia global del procesador de audio
 audio_processor = AudioProcessor(chunk_duration=0.2)
 
+# Pool de procesos para el procesamiento de audio (librosa es CPU-bound y retiene el GIL).
+# Los procesos se crean con forkserver: hacer fork del servidor, que ya tiene hilos (executor por
+# defecto, aiofiles), puede bloquearse. El tamaño está acotado porque cada worker de uvicorn
+# tiene su propio pool
+MAX_PROCESS_WORKERS = 4
+
+def new_executor() -> ProcessPoolExecutor:
+    """Pool de procesos nuevo (al arrancar o para sustituir uno roto)"""
+    return ProcessPoolExecutor(
+        max_workers=min(os.cpu_count() or 1, MAX_PROCESS_WORKERS),
+        mp_context=multiprocessing.get_context("forkserver")
+    )
+
+executor = new_executor()
+executor_lock = asyncio.Lock()  # Sustitución del pool cuando se rompe
+POOL_UNAVAILABLE_ERROR = {"error": "El servidor no pudo procesar la petición, inténtalo de nuevo"}
+
+async def run_in_pool(func, *args):
+    """Ejecuta func en el pool de procesos, sustituyéndolo y reintentando una vez si está roto
+    
+    Si un worker muere (OOM, fallo en un decodificador nativo) el pool queda roto para siempre:
+    todas las peticiones siguientes fallarían hasta reiniciar el servidor.
+    """
+    global executor
+    loop = asyncio.get_running_loop()
+    pool = executor
+    try:
+        return await loop.run_in_executor(pool, func, *args)
+    except BrokenProcessPool:
+        async with executor_lock:
+            # Varias peticiones ven el mismo pool roto: solo la primera lo sustituye
+            if executor is pool:
+                executor = new_executor()
+                pool.shutdown(wait=False, cancel_futures=True)
+                print("Pool de procesos roto: se sustituye por uno nuevo")
+        return await loop.run_in_executor(executor, func, *args)
+
+@app.exception_handler(BrokenProcessPool)
+async def broken_pool_handler(request: Request, exc: BrokenProcessPool):
+    """Si el pool se rompe también en el reintento (p. ej. al reconstruir una sesión), 503 en lugar de 500"""
+    return ORJSONResponse(POOL_UNAVAILABLE_ERROR, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+
 # Almacenamiento temporal de datos procesados
-processed_audio_data: Dict[str, List[AudioChunkData]] = {}  # {session_id: [AudioChunkData, ...]}
-processed_analysis_data: Dict[str, List[AudioAnalysisMessage]] = {}  # {session_id: [AudioAnalysisMessage, ...]}
-current_sessions = {}  # {session_id: {"file_info": ..., "status": ..., "analyzer": ...}}
+@dataclass(slots=True)
+class Session:
+    """Datos en memoria de una sesión procesada"""
+    file_info: AudioFileInfo
+    file_info_dump: Dict[str, Any]  # dict ya volcado: no cambia durante la sesión
+    chunks: AudioChunkArrays
+    analysis_json: List[bytes]  # JSON de cada AudioAnalysisMessage.model_dump()
+    audio_stat: os.stat_result  # stat del archivo subido: /audio lo reutiliza para Content-Length/ETag sin otro syscall
+
+current_sessions: Dict[str, Session] = {}  # {session_id: Session}
+# Caché en memoria por worker: la fuente de verdad compartida son audio_uploads/ y audio_cache/ en disco
 
 TEMP_BASE_DIR = os.path.join("audio_uploads")
 os.makedirs(TEMP_BASE_DIR, exist_ok=True) # Asegurarse de que el directorio base exista
 
+# Límite de sesiones en memoria: se desalojan las menos usadas y las inactivas
+MAX_SESSIONS = 256
+SESSION_TTL_SECONDS = 3600
+SESSION_REAP_INTERVAL_SECONDS = 60
+session_last_access: "OrderedDict[str, float]" = OrderedDict()  # {session_id: último acceso (monotonic)}, de más antiguo a más reciente
+
+def touch_session(session_id: str) -> None:
+    """Marca la sesión como usada recientemente"""
+    session_last_access[session_id] = time.monotonic()
+    session_last_access.move_to_end(session_id)
+
+def evict_sessions(free_slots: int = 0) -> None:
+    """Desaloja de memoria sesiones por LRU (dejando sitio para free_slots nuevas) o por inactividad (más de SESSION_TTL_SECONDS)
+    
+    Solo se libera la memoria: metadatos y caché siguen en disco y ensure_session la reconstruye si se vuelve a pedir.
+    Borrar el directorio le corresponde a sweep_session_dirs, que decide por la fecha de los metadatos
+    (otro worker puede seguir usando la sesión).
+    """
+    now = time.monotonic()
+    while session_last_access:
+        session_id, last_access = next(iter(session_last_access.items()))
+        expired = now - last_access >= SESSION_TTL_SECONDS
+        if len(session_last_access) + free_slots <= MAX_SESSIONS and not expired:
+            break
+        
+        del session_last_access[session_id]
+        current_sessions.pop(session_id, None)
+        print(f"Sesión {session_id} {'desalojada' if expired else 'volcada a disco'}")
+
+def sweep_session_dirs(live_sessions: frozenset) -> None:
+    """Borra los directorios de sesiones volcadas a disco que llevan más de SESSION_TTL_SECONDS sin usarse,
+    y las entradas de la caché de resultados caducadas que ya no usa ninguna sesión
+    
+    La fecha de modificación de los metadatos marca el último uso: las sesiones en memoria la renuevan en cada barrido.
+    """
+    now = time.time()
+    referenced = set()  # Entradas de caché de las sesiones que siguen en disco
+    for entry in os.scandir(TEMP_BASE_DIR):
+        meta_path = os.path.join(entry.path, SESSION_META_FILENAME)
+        try:
+            if entry.name in live_sessions:
+                os.utime(meta_path)
+            elif now - os.stat(meta_path).st_mtime >= SESSION_TTL_SECONDS:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                print(f"Sesión {entry.name} desalojada de disco")
+                continue
+            with open(meta_path, "rb") as f:
+                referenced.add(os.path.basename(cache_path_for(msgpack.unpackb(f.read())["digest"])))
+        except FileNotFoundError:
+            # Subida aún sin metadatos, o directorio borrado mientras tanto
+            continue
+        except SESSION_META_ERRORS:
+            # Metadatos dañados: la sesión no se puede reconstruir y su directorio queda huérfano,
+            # se borra cuando caduque como cualquier otro
+            print(f"Metadatos dañados en la sesión {entry.name}")
+            continue
+    
+    for entry in os.scandir(CACHE_DIR):
+        if entry.name in referenced:
+            continue
+        try:
+            age = now - entry.stat().st_mtime
+            if entry.name.endswith(".tmp"):
+                # Escritura a medias: sólo se borra si quedó huérfana de un proceso caído
+                expired = age >= SESSION_TTL_SECONDS
+            else:
+                expired = not entry.name.endswith(CACHE_SUFFIX) or age >= CACHE_TTL_SECONDS
+            if expired:
+                os.remove(entry.path)
+                print(f"Entrada de caché {entry.name} eliminada")
+        except FileNotFoundError:
+            continue
+
+async def reap_sessions() -> None:
+    """Desaloja periódicamente las sesiones inactivas, aunque no lleguen subidas nuevas"""
+    while True:
+        await asyncio.sleep(SESSION_REAP_INTERVAL_SECONDS)
+        # Un fallo en un barrido no debe matar la tarea: se registra y se reintenta en el siguiente
+        try:
+            evict_sessions()
+            await asyncio.to_thread(sweep_session_dirs, frozenset(current_sessions))
+        except Exception as e:
+            print(f"Error desalojando sesiones: {e!r}")
+
+# Tamaño de bloque al copiar las subidas a disco
+UPLOAD_READ_SIZE = 1 << 20
+
+# Los clientes que envían "Accept: application/msgpack" reciben los lotes en MessagePack
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+def wants_msgpack(request: Request) -> bool:
+    """Indica si el cliente pidió la respuesta en MessagePack en lugar de JSON"""
+    return MSGPACK_MEDIA_TYPE in request.headers.get("accept", "")
+
+def msgpack_response(payload: Dict) -> Response:
+    """Respuesta binaria MessagePack (floats de 4 bytes: de sobra para la visualización)"""
+    return Response(content=msgpack.packb(payload, use_single_float=True), media_type=MSGPACK_MEDIA_TYPE)
+
+def spliced_json_response(payload: Dict, key: str, json_rows: List[bytes]) -> Response:
+    """Respuesta JSON que empalma en payload[key] filas ya codificadas, sin volver a serializarlas"""
+    rows_json = b"[" + b",".join(json_rows) + b"]"
+    return Response(content=orjson.dumps(payload)[:-1] + b',"' + key.encode() + b'":' + rows_json + b"}", media_type="application/json")
+
+# Caché de resultados indexada por el hash del contenido del archivo subido
+CACHE_DIR = os.path.join("audio_cache")
+os.makedirs(CACHE_DIR, exist_ok=True)
+
+# Versión del procesamiento: subirla cuando cambie el cálculo de características o de análisis,
+# así los resultados guardados con la versión anterior dejan de servirse (y el barrido los borra)
+CACHE_VERSION = 2
+CACHE_SUFFIX = f".v{CACHE_VERSION}.msgpack"
+CACHE_TTL_SECONDS = 24 * 3600  # Entradas sin usar ni referenciadas por ninguna sesión
+
+def cache_path_for(digest: str) -> str:
+    """Ruta en la caché del resultado de un contenido con la versión actual del procesamiento"""
+    return os.path.join(CACHE_DIR, f"{digest}{CACHE_SUFFIX}")
+
+def load_cached_result(cache_path: str, file_path: str) -> Tuple[AudioFileInfo, int, AudioChunkArrays, List[Dict[str, Any]], os.stat_result]:
+    """Reconstruye un resultado procesado previamente desde la caché en disco, junto con el stat del archivo subido"""
+    with open(cache_path, "rb") as f:
+        cached = msgpack.unpackb(f.read())
+    os.utime(cache_path)  # Marca de último uso para la caducidad de la caché
+    
+    # El mismo contenido puede llegar con otro nombre: la ruta es la de esta sesión
+    file_info = AudioFileInfo(**{**cached["file_info"], "filename": file_path.split('/')[-1], "file_path": file_path})
+    all_chunks = AudioChunkArrays.from_columns(cached["chunks"])
+    all_chunks.build_json_rows()
+    return file_info, cached["total_chunks"], all_chunks, cached["analysis"], os.stat(file_path)
+
+def save_cached_result(cache_path: str, file_info: AudioFileInfo, total_chunks: int,
+                       all_chunks: AudioChunkArrays, all_analysis: List[Dict[str, Any]]) -> None:
+    """Guarda el resultado procesado en la caché (escritura atómica)"""
+    payload = msgpack.packb({
+        "file_info": file_info.model_dump(),
+        "total_chunks": total_chunks,
+        "chunks": all_chunks.to_columns(),
+        "analysis": all_analysis
+    })
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+    os.replace(tmp_path, cache_path)
+
+# Metadatos de cada sesión en su directorio: permiten que cualquier worker de uvicorn
+# (o un worker tras reiniciarse) reconstruya desde disco una sesión que no tiene en memoria
+SESSION_META_FILENAME = "session.msgpack"
+# Errores al decodificar unos metadatos dañados (msgpack lanza ValueError y sus subclases)
+SESSION_META_ERRORS = (ValueError, KeyError, TypeError)
+
+def save_session_meta(session_id: str, file_path: str, digest: str) -> None:
+    """Guarda junto al archivo subido lo necesario para reconstruir la sesión (escritura atómica)"""
+    meta_path = os.path.join(TEMP_BASE_DIR, session_id, SESSION_META_FILENAME)
+    tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(msgpack.packb({"file_path": file_path, "digest": digest}))
+    os.replace(tmp_path, meta_path)
+
+def load_session(session_id: str) -> Optional[Tuple[AudioFileInfo, int, AudioChunkArrays, List[Dict[str, Any]], os.stat_result]]:
+    """Reconstruye una sesión desde sus metadatos y la caché de resultados (se ejecuta en el pool de procesos)"""
+    meta_path = os.path.join(TEMP_BASE_DIR, session_id, SESSION_META_FILENAME)
+    try:
+        with open(meta_path, "rb") as f:
+            meta = msgpack.unpackb(f.read())
+        return load_cached_result(cache_path_for(meta["digest"]), meta["file_path"])
+    except FileNotFoundError:
+        # Sesión inexistente, o desalojada (su directorio se borra en segundo plano)
+        return None
+    except SESSION_META_ERRORS:
+        # Metadatos dañados: la sesión no se puede reconstruir, igual que si no existiera
+        print(f"Metadatos dañados en la sesión {session_id}")
+        return None
+
+def register_session(session_id: str, file_info: AudioFileInfo, all_chunks: AudioChunkArrays,
+                     all_analysis: List[Dict[str, Any]], audio_stat: os.stat_result) -> Session:
+    """Guarda en memoria los datos procesados de una sesión (audio_stat viene del pool de procesos: aquí no se toca el disco)"""
+    evict_sessions(free_slots=1)
+    
+    # Los análisis no cambian: se codifican a JSON una sola vez, igual que los chunks, y solo
+    # se conservan esos bytes (ocupan bastante menos que los dicts anidados de Python)
+    session = Session(
+        file_info=file_info,
+        file_info_dump=file_info.model_dump(),
+        chunks=all_chunks,
+        analysis_json=[orjson.dumps(analysis) for analysis in all_analysis],
+        audio_stat=audio_stat
+    )
+    current_sessions[session_id] = session
+    touch_session(session_id)
+    return session
+
+async def ensure_session(session_id: str) -> bool:
+    """Indica si la sesión existe, reconstruyéndola desde disco si este worker no la tiene en memoria"""
+    if session_id in current_sessions:
+        touch_session(session_id)
+        return True
+    
+    # El session_id forma parte de rutas en disco: solo se aceptan 32 dígitos hexadecimales (con o sin guiones)
+    try:
+        uuid.UUID(session_id)
+    except ValueError:
+        return False
+    
+    result = await run_in_pool(load_session, session_id)
+    if result is None:
+        return False
+    
+    file_info, _, all_chunks, all_analysis, audio_stat = result
+    register_session(session_id, file_info, all_chunks, all_analysis, audio_stat)
+    print(f"Sesión {session_id} reconstruida desde disco")
+    return True
+
+def build_analysis_message(chunk_dict: Dict[str, Any], relationships: AudioRelationships, chunks_analyzed: int) -> Dict[str, Any]:
+    """Dict con la forma de AudioAnalysisMessage.model_dump(), sin construir ni validar el modelo"""
+    return {
+        "current_chunk": chunk_dict,
+        "relationships": relationships.model_dump(),
+        "analysis_timestamp": chunk_dict["timestamp"],
+        "chunks_analyzed": chunks_analyzed
+    }
+
+def process_audio_file(file_path: str, session_id: str, digest: str) -> Tuple[AudioFileInfo, int, AudioChunkArrays, List[Dict[str, Any]], os.stat_result]:
+    """Carga el audio y procesa todos sus chunks y análisis (se ejecuta en el pool de procesos)"""
+    
+    # Si este contenido ya se procesó, reutilizar el resultado sin tocar librosa
+    cache_path = cache_path_for(digest)
+    save_session_meta(session_id, file_path, digest)
+    if os.path.exists(cache_path):
+        print(f"Resultado en caché para sesión {session_id}: {cache_path}")
+        return load_cached_result(cache_path, file_path)
+    
+    # Cargar información del archivo
+    file_info, audio_data, sample_rate = audio_processor.load_audio(file_path)
+    
+    # Calcular número total de chunks (división entera redondeando hacia arriba)
+    chunk_samples = audio_processor.chunk_samples_for(sample_rate)
+    total_chunks = -(-len(audio_data) // chunk_samples)
+    
+    print(f"Procesando {total_chunks} chunks para sesión {session_id}...")
+    
+    # Crear analizador para esta sesión
+    analyzer = AudioAnalyzer(analysis_window_size=25)
+    
+    # Procesar TODOS los chunks inmediatamente, directamente al almacenamiento columnar
+    all_chunks = audio_processor.process_track(audio_data, sample_rate)
+    all_analysis = []
+    
+    # Análisis completo cada 5 chunks (1 segundo) y al final si quedan chunks sin analizar.
+    # El analizador lee directamente las columnas: solo se construye el dict de los chunks analizados
+    for chunks_analyzed, relationships in analyzer.analyze_batched(all_chunks, stride=5):
+        current_chunk = all_chunks.to_dicts(chunks_analyzed - 1, chunks_analyzed)[0]
+        all_analysis.append(build_analysis_message(current_chunk, relationships, chunks_analyzed))
+    
+    print(f"Procesamiento completo: {len(all_chunks)} chunks, {len(all_analysis)} análisis")
+    
+    # Codificar los chunks a JSON aquí, en el worker, y no en cada petición
+    all_chunks.build_json_rows()
+    
+    save_cached_result(cache_path, file_info, total_chunks, all_chunks, all_analysis)
+    
+    return file_info, total_chunks, all_chunks, all_analysis, os.stat(file_path)
+
+
 @app.post("/upload")
 async def upload_audio(file: UploadFile = File(...)):
     """Endpoint para subir archivo de audio MP3 y procesar todos los chunks inmediatamente"""
@@ -45,89 +408,40 @@ async def upload_audio(file: UploadFile = File(...)):
     if not file.filename.lower().endswith('.mp3'):
         return {"error": "Solo se permiten archivos MP3"}
     
-    session_id = str(uuid.uuid4())
+    # Cuerpos sin Content-Length (chunked) no pasan por el middleware: no decodificar si son demasiado grandes
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        return ORJSONResponse(UPLOAD_TOO_LARGE_ERROR, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    
+    session_id = os.urandom(16).hex()  # 128 bits aleatorios, como uuid4, sin formatear el UUID
 
     session_file_dir = os.path.join(TEMP_BASE_DIR, session_id)
-    os.makedirs(session_file_dir, exist_ok=True)
+    await asyncio.to_thread(os.makedirs, session_file_dir, exist_ok=True)
 
     file_path = os.path.join(session_file_dir, file.filename)
 
     try:
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        # Copiar a disco por bloques de 1 MiB (sin cargar todo el archivo en memoria),
+        # calculando a la vez el hash del contenido para la caché de resultados
+        hasher = hashlib.blake2b(digest_size=16)
+        async with aiofiles.open(file_path, "wb") as buffer:
+            while content := await file.read(UPLOAD_READ_SIZE):
+                hasher.update(content)
+                await buffer.write(content)
+        digest = hasher.hexdigest()
         
         print(f"Archivo '{file.filename}' guardado en: {file_path}") # Para depuración
         
-        # Cargar información del archivo
-        file_info, audio_data, sample_rate = audio_processor.load_audio(file_path)
-        
-        # Calcular número total de chunks
-        chunk_samples = int(audio_processor.chunk_duration * sample_rate)
-        total_chunks = len(audio_data) // chunk_samples + (1 if len(audio_data) % chunk_samples else 0)
-        
-        print(f"Procesando {total_chunks} chunks para sesión {session_id}...")
-        
-        # Crear analizador para esta sesión
-        analyzer = AudioAnalyzer(analysis_window_size=25)
-        
-        # Procesar TODOS los chunks inmediatamente
-        all_chunks = []
-        all_analysis = []
-        
-        chunk_generator = audio_processor.process_chunks(audio_data, sample_rate)
-        chunk_counter = 0
-        
-        for chunk_data in chunk_generator:
-            # Guardar el chunk
-            all_chunks.append(chunk_data)
-            
-            # Añadir chunk al analizador
-            analyzer.add_chunk(chunk_data)
-            
-            # Cada 5 chunks (1 segundo), hacer análisis completo
-            chunk_counter += 1
-            if chunk_counter % 5 == 0:
-                relationships = analyzer.analyze_relationships()
-                
-                if relationships:
-                    analysis_message = AudioAnalysisMessage(
-                        current_chunk=chunk_data,
-                        relationships=relationships,
-                        analysis_timestamp=chunk_data.timestamp,
-                        chunks_analyzed=chunk_counter
-                    )
-                    all_analysis.append(analysis_message)
-        
-        # Análisis final si quedan chunks sin analizar
-        if chunk_counter % 5 != 0:
-            relationships = analyzer.analyze_relationships()
-            if relationships and chunk_counter > 0:
-                analysis_message = AudioAnalysisMessage(
-                    current_chunk=all_chunks[-1],
-                    relationships=relationships,
-                    analysis_timestamp=all_chunks[-1].timestamp,
-                    chunks_analyzed=chunk_counter
-                )
-                all_analysis.append(analysis_message)
+        # Decodificar y procesar en el pool de procesos para no bloquear el event loop
+        file_info, total_chunks, all_chunks, all_analysis, audio_stat = await run_in_pool(
+            process_audio_file, file_path, session_id, digest
+        )
         
         # Guardar datos procesados para acceso posterior si es necesario
-        processed_audio_data[session_id] = all_chunks
-        processed_analysis_data[session_id] = all_analysis
-        
-        print(f"Procesamiento completo: {chunk_counter} chunks, {len(all_analysis)} análisis")
-        
-        # Guardar información de sesión básica para el frontend
-        current_sessions[session_id] = {
-            "file_info": file_info,
-            "total_chunks": total_chunks,
-            "total_analysis": len(all_analysis),
-            "processing_complete": True
-        }
+        session = register_session(session_id, file_info, all_chunks, all_analysis, audio_stat)
         
         return {
             "session_id": session_id,
-            "file_info": file_info.model_dump(),
+            "file_info": session.file_info_dump,
             "total_chunks": total_chunks,
             "total_analysis": len(all_analysis),
             "processing_complete": True
@@ -135,7 +449,14 @@ async def upload_audio(file: UploadFile = File(...)):
         
     except Exception as e:
         print(f"Error procesando archivo: {e}")
-        return {"error": f"Error procesando archivo: {str(e)}"}
+        # No dejar en disco el directorio ni el archivo parcial de una subida fallida
+        await asyncio.to_thread(shutil.rmtree, session_file_dir, ignore_errors=True)
+        if isinstance(e, AudioTooLongError):
+            return ORJSONResponse({"error": str(e)}, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        if isinstance(e, BrokenProcessPool):
+            # El reintento también rompió el pool (probablemente este mismo archivo)
+            return ORJSONResponse(POOL_UNAVAILABLE_ERROR, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return ORJSONResponse({"error": f"Error procesando archivo: {str(e)}"}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
 @app.get("/")
@@ -143,54 +464,77 @@ async def root():
     return {"message": "Synchro-Nice Backend API"}
 
 @app.get("/session/{session_id}/chunks")
-async def get_chunks_batch(session_id: str, start: int = 0, limit: int = 100):
-    """Endpoint para obtener chunks en lotes progresivos"""
+async def get_chunks_batch(request: Request, session_id: str, start: int = 0, limit: int = 100):
+    """Endpoint para obtener chunks en lotes progresivos (JSON o MessagePack según Accept)"""
     
-    if session_id not in processed_audio_data:
+    if not await ensure_session(session_id):
         return {"error": "Sesión no encontrada"}
     
-    all_chunks = processed_audio_data[session_id]
+    all_chunks = current_sessions[session_id].chunks
     end_index = min(start + limit, len(all_chunks))
-    chunk_batch = all_chunks[start:end_index]
     
-    return {
+    payload = {
         "session_id": session_id,
         "start": start,
         "end": end_index,
         "total_chunks": len(all_chunks),
-        "has_more": end_index < len(all_chunks),
-        "chunks": [chunk.model_dump() for chunk in chunk_batch]
+        "has_more": end_index < len(all_chunks)
     }
+    
+    if wants_msgpack(request):
+        payload["chunks"] = all_chunks.to_dicts(start, end_index)
+        return msgpack_response(payload)
+    
+    # JSON: se empalman los chunks ya codificados en lugar de volver a serializarlos
+    return spliced_json_response(payload, "chunks", all_chunks.json_rows[start:end_index])
 
 @app.get("/session/{session_id}/analysis")
-async def get_analysis_batch(session_id: str, start: int = 0, limit: int = 50):
-    """Endpoint para obtener análisis en lotes progresivos"""
+async def get_analysis_batch(request: Request, session_id: str, start: int = 0, limit: int = 50):
+    """Endpoint para obtener análisis en lotes progresivos (JSON o MessagePack según Accept)"""
     
-    if session_id not in processed_analysis_data:
+    if not await ensure_session(session_id):
         return {"error": "Sesión no encontrada"}
     
-    all_analysis = processed_analysis_data[session_id]
+    all_analysis = current_sessions[session_id].analysis_json
     end_index = min(start + limit, len(all_analysis))
-    analysis_batch = all_analysis[start:end_index]
     
-    return {
+    payload = {
         "session_id": session_id,
         "start": start,
         "end": end_index,
         "total_analysis": len(all_analysis),
-        "has_more": end_index < len(all_analysis),
-        "analysis": [analysis.model_dump() for analysis in analysis_batch]
+        "has_more": end_index < len(all_analysis)
     }
+    
+    if wants_msgpack(request):
+        payload["analysis"] = [orjson.loads(analysis) for analysis in all_analysis[start:end_index]]
+        return msgpack_response(payload)
+    
+    # JSON: se empalman los análisis ya codificados en lugar de volver a serializarlos
+    return spliced_json_response(payload, "analysis", all_analysis[start:end_index])
 
 @app.get("/audio/{session_id}")
 async def get_audio_file(session_id: str):
     """Endpoint para servir el archivo de audio temporal por su session_id."""
-    if session_id not in current_sessions:
+    if not await ensure_session(session_id):
         return Response(status_code=status.HTTP_400_BAD_REQUEST)
 
-    file_path = current_sessions[session_id]["file_info"].file_path
+    session = current_sessions[session_id]
+    file_path = session.file_info.file_path
     if not os.path.exists(file_path):
         return Response(status_code=status.HTTP_404_NOT_FOUND)
 
-    return FileResponse(path=file_path, media_type="audio/mpeg", filename=os.path.basename(file_path))
+    # El archivo de una sesión no cambia: se reutiliza su stat y se permite cachearlo
+    return FileResponse(
+        path=file_path,
+        media_type="audio/mpeg",
+        filename=os.path.basename(file_path),
+        stat_result=session.audio_stat,
+        headers={"Cache-Control": "public, max-age=3600"}
+    )
+
 
+if __name__ == "__main__":
+    # Arranque recomendado: event loop uvloop y parser HTTP httptools (ver Dockerfile)
+    import uvicorn
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, loop="uvloop", http="httptools")
@@ -1,6 +1,10 @@
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import json
+import numpy as np
+import orjson
+
+N_BANDS = 20  # Número de bandas de frecuencia de cada chunk (fijo en todo el servidor)
 
 class AudioChunkData(BaseModel):
     """Estructura de datos para cada chunk de audio procesado"""
@@ -17,6 +21,53 @@ class AudioChunkData(BaseModel):
     beat_strength: float # Cuán fuerte o claro es el pulso rítmico en este chunk (0.0 a 1.0)
     tempo: float # Velocidad de la música en pulsos por minuto (BPM)
 
+class AudioChunkArrays:
+    """Almacenamiento columnar (un array de NumPy por campo) de todos los chunks de una sesión.
+    
+    Sustituye a la lista de AudioChunkData: cada campo vive en un único array contiguo
+    y los dicts con la forma de AudioChunkData solo se construyen al servirlos.
+    """
+    FIELDS = list(AudioChunkData.model_fields)
+    
+    def __init__(self, n_chunks: int, n_bands: int = N_BANDS, n_chroma: int = 12):
+        self.timestamp = np.zeros(n_chunks, dtype=np.float64)
+        self.frequencies = np.zeros((n_chunks, n_bands), dtype=np.float32)
+        self.amplitude = np.zeros(n_chunks, dtype=np.float32)
+        self.brightness = np.zeros(n_chunks, dtype=np.float32)
+        self.energy_center = np.zeros(n_chunks, dtype=np.float32)
+        self.is_percussive = np.zeros(n_chunks, dtype=bool)
+        self.rolloff = np.zeros(n_chunks, dtype=np.float32)
+        self.zero_crossing_rate = np.zeros(n_chunks, dtype=np.float32)
+        self.spectral_flatness = np.zeros(n_chunks, dtype=np.float32)
+        self.chroma_features = np.zeros((n_chunks, n_chroma), dtype=np.float32)
+        self.beat_strength = np.zeros(n_chunks, dtype=np.float32)
+        self.tempo = np.zeros(n_chunks, dtype=np.float32)
+        self.json_rows: List[bytes] = []  # JSON de cada chunk, codificado una sola vez (build_json_rows)
+    
+    def __len__(self) -> int:
+        return len(self.timestamp)
+    
+    def to_dicts(self, start: int, end: int) -> List[Dict[str, Any]]:
+        """Devuelve los chunks [start, end) como dicts con la forma de AudioChunkData.model_dump()"""
+        columns = [getattr(self, name)[start:end].tolist() for name in self.FIELDS]
+        return [dict(zip(self.FIELDS, values)) for values in zip(*columns)]
+    
+    def build_json_rows(self) -> None:
+        """Codifica cada chunk a JSON una sola vez para servir los lotes sin volver a serializar"""
+        self.json_rows = [orjson.dumps(chunk) for chunk in self.to_dicts(0, len(self))]
+    
+    def to_columns(self) -> Dict[str, list]:
+        """Columnas como listas de Python (para serializar en la caché)"""
+        return {name: getattr(self, name).tolist() for name in self.FIELDS}
+    
+    @classmethod
+    def from_columns(cls, columns: Dict[str, list]) -> "AudioChunkArrays":
+        """Reconstruye el almacenamiento a partir de to_columns()"""
+        arrays = cls(0)
+        for name in cls.FIELDS:
+            setattr(arrays, name, np.asarray(columns[name], dtype=getattr(arrays, name).dtype))
+        return arrays
+
 # Nuevos modelos para análisis de relaciones
 
 class TransitionAnalysis(BaseModel):
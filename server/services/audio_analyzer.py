@@ -1,79 +1,275 @@
 import numpy as np
-from typing import List, Dict, Any, Optional
-from collections import deque
-from scipy import stats
-from scipy.signal import find_peaks
-import warnings
+from typing import List, Dict, Any, Optional, Tuple, NamedTuple
+from dataclasses import dataclass
+from functools import lru_cache
 from models.models import (
-    AudioChunkData, TransitionAnalysis, TrendAnalysis, 
+    N_BANDS, AudioChunkData, AudioChunkArrays, TransitionAnalysis, TrendAnalysis, 
     PatternAnalysis, PredictionAnalysis, AudioRelationships
 )
 
+class AxisStats(NamedTuple):
+    """Eje x = 0..n-1 de una regresión lineal y sus momentos"""
+    x: np.ndarray
+    sum_x: float
+    sum_xx: float
+    denom: float  # n·Σx² - (Σx)²
+
+@lru_cache(maxsize=8)
+def _x_stats(n: int) -> AxisStats:
+    """Momentos del eje x para ventanas de n chunks (solo hay unas pocas longitudes distintas)"""
+    x = np.arange(n, dtype=np.float64)
+    x.flags.writeable = False  # Compartido entre llamadas
+    sum_x = float(x.sum())
+    sum_xx = float(x @ x)
+    return AxisStats(x, sum_x, sum_xx, n * sum_xx - sum_x * sum_x)
+
+def _local_peaks(values: np.ndarray, height: float) -> np.ndarray:
+    """Máximos locales con valor >= height, igual que scipy.signal.find_peaks(values, height=height, distance=2)
+    
+    Una meseta cuenta como un único pico en su punto medio. Dos máximos locales nunca están
+    a menos de 2 muestras, así que distance=2 no descartaba ninguno.
+    """
+    # Agrupar muestras consecutivas iguales en tramos
+    starts = np.flatnonzero(np.diff(values, prepend=np.nan) != 0)
+    ends = np.append(starts[1:] - 1, len(values) - 1)
+    levels = values[starts]
+    
+    # Tramos interiores más altos que sus dos vecinos
+    inner = np.arange(1, len(starts) - 1)
+    is_peak = (levels[inner] > levels[inner - 1]) & (levels[inner] > levels[inner + 1]) & (levels[inner] >= height)
+    peaks = inner[is_peak]
+    return (starts[peaks] + ends[peaks]) // 2
+
+def _ols(y: np.ndarray) -> Tuple[float, float]:
+    """Pendiente y ordenada en el origen de la recta de mínimos cuadrados de y sobre x = 0..n-1"""
+    n = len(y)
+    axis = _x_stats(n)
+    sum_y = float(y.sum())
+    slope = (n * float(axis.x @ y) - axis.sum_x * sum_y) / axis.denom
+    intercept = (sum_y - slope * axis.sum_x) / n
+    return slope, intercept
+
+def _clip(value: float, low: float, high: float) -> float:
+    """np.clip para un escalar, sin pasar por NumPy"""
+    return min(max(value, low), high)
+
+class WindowSweep(NamedTuple):
+    """Lo que tendencias y predicciones necesitan de la ventana de análisis, calculado una sola vez"""
+    slopes: np.ndarray  # Pendiente de la recta de mínimos cuadrados de cada serie
+    intercepts: np.ndarray  # Ordenada en el origen de cada serie
+    y_range: np.ndarray  # max - min de cada serie
+
+@dataclass(slots=True)
+class ChunkWindow:
+    """Vista (sin copias) de los últimos chunks del buffer: una fila por serie, una columna por chunk"""
+    series: np.ndarray  # (3 + bandas, chunks): amplitud, brightness, beat_strength y cada banda
+    
+    @property
+    def amplitude(self) -> np.ndarray:
+        return self.series[0]
+    
+    @property
+    def brightness(self) -> np.ndarray:
+        return self.series[1]
+    
+    @property
+    def beat_strength(self) -> np.ndarray:
+        return self.series[2]
+    
+    @property
+    def frequencies(self) -> np.ndarray:
+        return self.series[3:].T  # (chunks, bandas)
+    
+    def __len__(self) -> int:
+        return self.series.shape[1]
+    
+    def tail(self, k: int) -> "ChunkWindow":
+        """Últimos k chunks de la ventana"""
+        return ChunkWindow(self.series[:, max(len(self) - k, 0):])
+
+# Resultados por defecto para ventanas con pocos datos. Se construyen una sola vez y se comparten:
+# los análisis no se modifican después de crearlos, solo se serializan
+_DEFAULT_TRANSITION = TransitionAnalysis.model_construct(
+    amplitude_delta=0.0,
+    brightness_delta=0.0,
+    beat_strength_delta=0.0,
+    frequency_deltas=[0.0] * N_BANDS,
+    transition_smoothness=1.0,
+    change_velocity=0.0,
+    energy_direction="stable"
+)
+
+_DEFAULT_TREND = TrendAnalysis.model_construct(
+    amplitude_trend=0.0,
+    brightness_trend=0.0,
+    beat_strength_trend=0.0,
+    frequency_trends=[0.0] * N_BANDS,
+    overall_energy_trend=0.0,
+    trend_strength=0.0,
+    volatility=0.0
+)
+
+_DEFAULT_PATTERN = PatternAnalysis.model_construct(
+    detected_patterns=[],
+    pattern_strength=0.0,
+    cycle_length=None,
+    pattern_confidence=0.0
+)
+
+_DEFAULT_PREDICTION = PredictionAnalysis.model_construct(
+    predicted_amplitude=0.5,
+    predicted_brightness=0.5,
+    predicted_beat_strength=0.5,
+    predicted_energy_change="stable",
+    drop_probability=0.0,
+    buildup_probability=0.0,
+    break_probability=0.0
+)
+
 class AudioAnalyzer:
     def __init__(self, analysis_window_size: int = 25):
         self.analysis_window_size = analysis_window_size  # 25 chunks = 5 segundos
         self.transition_window = 5  # Para análisis de transiciones
-        
-        # Buffer completo para detección de patrones a largo plazo
-        self.full_buffer: List[AudioChunkData] = []
-        
-        # Buffer circular para análisis de ventana
-        self.window_buffer: deque = deque(maxlen=analysis_window_size)
-        
+        self.pattern_window = 40  # Últimos 8 segundos para detección de patrones
+        
+        # Buffer circular (una columna por chunk): solo se guardan los chunks que usa
+        # algún análisis, aunque buffer_size siga contando todos los recibidos.
+        # Cada chunk se escribe dos veces (en head y en head + capacity), así cualquier
+        # ventana es un tramo contiguo del array aunque dé la vuelta al buffer
+        self._capacity = max(analysis_window_size, self.pattern_window)
+        self._head = 0  # Columna donde se escribirá el próximo chunk
+        self._count = 0  # Chunks añadidos en total
+        self._series = np.empty((3 + N_BANDS, 2 * self._capacity))
+        
+        # Estadísticos suficientes de la ventana de análisis (x = 0..n-1) para cada serie: Σy, Σxy.
+        # Se actualizan al añadir cada chunk, así las pendientes no recorren la ventana
+        self._window_len = 0
+        self._sum_y = np.zeros(3 + N_BANDS)
+        self._sum_xy = np.zeros(3 + N_BANDS)
+    
     def add_chunk(self, chunk: AudioChunkData) -> None:
         """Añade un nuevo chunk a los buffers"""
-        self.full_buffer.append(chunk)
-        self.window_buffer.append(chunk)
+        if len(chunk.frequencies) != N_BANDS:
+            raise ValueError(f"Se esperaban {N_BANDS} bandas de frecuencia, llegaron {len(chunk.frequencies)}")
+        
+        column = np.empty(len(self._series))
+        column[0] = chunk.amplitude
+        column[1] = chunk.brightness
+        column[2] = chunk.beat_strength
+        column[3:] = chunk.frequencies
+        self._push(column)
+    
+    def add_rows(self, arrays: AudioChunkArrays, start: int, end: int) -> None:
+        """Añade los chunks [start, end) copiando directamente desde el almacenamiento columnar"""
+        block = np.vstack((
+            arrays.amplitude[start:end],
+            arrays.brightness[start:end],
+            arrays.beat_strength[start:end],
+            arrays.frequencies[start:end].T
+        ))
+        for column in block.T:
+            self._push(column)
+    
+    def _push(self, column: np.ndarray) -> None:
+        """Escribe un chunk en el buffer circular y desliza los estadísticos de la ventana de análisis"""
+        if self._window_len == self.analysis_window_size:
+            # Sale el chunk más antiguo de la ventana (x = 0) y el resto baja una posición en x
+            oldest = self._series[:, (self._head - self._window_len) % self._capacity]
+            self._sum_y -= oldest
+            self._sum_xy -= self._sum_y
+            self._window_len -= 1
+        
+        # Se usa la columna ya guardada (float64) para que las sumas no se redondeen en float32
+        self._series[:, self._head] = column
+        self._series[:, self._head + self._capacity] = column
+        column = self._series[:, self._head]
+        self._sum_xy += self._window_len * column
+        self._sum_y += column
+        self._window_len += 1
+        
+        self._head = (self._head + 1) % self._capacity
+        self._count += 1
+        
+        # En cada vuelta completa del buffer se recalculan exactos para que no acumulen error de redondeo
+        if self._head == 0:
+            window = self._window(self._window_len).series
+            x = _x_stats(self._window_len).x
+            self._sum_y = window.sum(axis=1)
+            self._sum_xy = window @ x
+    
+    def _window(self, k: int) -> ChunkWindow:
+        """Vista (sin copias) de los últimos k chunks añadidos"""
+        k = min(k, self._count, self._capacity)
+        end = self._head + self._capacity
+        return ChunkWindow(self._series[:, end - k:end])
+    
+    def analyze_batched(self, arrays: AudioChunkArrays, stride: int = 5) -> List[Tuple[int, AudioRelationships]]:
+        """Añade todos los chunks por bloques de `stride` y analiza tras cada bloque.
+        
+        Devuelve (chunks analizados hasta ese momento, relaciones) por cada análisis con datos suficientes.
+        """
+        # Un análisis cada `stride` chunks, más uno final si el último bloque queda incompleto
+        ends = list(range(stride, len(arrays) + 1, stride))
+        if len(arrays) % stride:
+            ends.append(len(arrays))
+        
+        results = []
+        start = 0
+        for end in ends:
+            self.add_rows(arrays, start, end)
+            start = end
+            
+            relationships = self.analyze_relationships()
+            if relationships:
+                results.append((end, relationships))
+        return results
     
     def analyze_relationships(self) -> Optional[AudioRelationships]:
         """Analiza las relaciones entre chunks. Solo funciona con suficientes datos."""
-        if len(self.window_buffer) < 2:
+        window = self._window(self.analysis_window_size)
+        if len(window) < 2:
             return None
+        
+        # Regresiones, rangos y tendencia energética de la ventana los usan tanto tendencias
+        # como predicciones: se calculan una sola vez
+        sweep = self._sweep(window)
+        energy_trend = self._calculate_overall_energy_trend(window)
             
-        return AudioRelationships(
-            transitions=self._analyze_transitions(),
-            trends=self._analyze_trends(),
+        return AudioRelationships.model_construct(
+            transitions=self._analyze_transitions(window),
+            trends=self._analyze_trends(window, sweep, energy_trend),
             patterns=self._analyze_patterns(),
-            predictions=self._make_predictions(),
-            analysis_window_size=len(self.window_buffer),
-            buffer_size=len(self.full_buffer)
+            predictions=self._make_predictions(window, sweep, energy_trend),
+            analysis_window_size=len(window),
+            buffer_size=self._count
         )
     
-    def _analyze_transitions(self) -> TransitionAnalysis:
+    def _analyze_transitions(self, window: ChunkWindow) -> TransitionAnalysis:
         """Analiza transiciones entre chunks recientes"""
-        if len(self.window_buffer) < 2:
-            return self._default_transition_analysis()
-        
         # Obtener últimos chunks para análisis de transiciones
-        recent_chunks: List[AudioChunkData] = list(self.window_buffer)[-min(self.transition_window, len(self.window_buffer)):]
+        recent = window.tail(self.transition_window)
         
-        if len(recent_chunks) < 2:
+        if len(recent) < 2:
             return self._default_transition_analysis()
         
-        current = recent_chunks[-1]
-        previous = recent_chunks[-2]
+        # Calcular deltas de todas las series (escalares y bandas de frecuencia) con una sola resta
+        deltas = (recent.series[:, -1] - recent.series[:, -2]).tolist()
+        amplitude_delta, brightness_delta, beat_strength_delta = deltas[:3]
+        frequency_deltas = deltas[3:]
         
-        # Calcular deltas
-        amplitude_delta = current.amplitude - previous.amplitude
-        brightness_delta = current.brightness - previous.brightness
-        beat_strength_delta = current.beat_strength - previous.beat_strength
-        
-        # Deltas de frecuencias
-        frequency_deltas = [
-            curr_freq - prev_freq 
-            for curr_freq, prev_freq in zip(current.frequencies, previous.frequencies)
-        ]
+        # Con tan pocos chunks es más rápido operar con floats de Python que con arrays
+        amplitudes = recent.amplitude.tolist()
         
         # Calcular suavidad de transición
-        transition_smoothness = self._calculate_transition_smoothness(recent_chunks)
+        transition_smoothness = self._calculate_transition_smoothness(amplitudes)
         
         # Calcular velocidad de cambio
-        change_velocity = self._calculate_change_velocity(recent_chunks)
+        change_velocity = self._calculate_change_velocity(amplitudes)
         
         # Determinar dirección energética
-        energy_direction = self._determine_energy_direction(recent_chunks)
+        energy_direction = self._determine_energy_direction(amplitudes)
         
-        return TransitionAnalysis(
+        return TransitionAnalysis.model_construct(
             amplitude_delta=amplitude_delta,
             brightness_delta=brightness_delta,
             beat_strength_delta=beat_strength_delta,
@@ -83,90 +279,67 @@ class AudioAnalyzer:
             energy_direction=energy_direction
         )
     
-    def _analyze_trends(self) -> TrendAnalysis:
+    def _analyze_trends(self, window: ChunkWindow, sweep: WindowSweep, energy_trend: float) -> TrendAnalysis:
         """Analiza tendencias en la ventana completa"""
-        if len(self.window_buffer) < 3:
+        if len(window) < 3:
             return self._default_trend_analysis()
         
-        chunks: List[AudioChunkData] = list(self.window_buffer)
-        
-        # Extraer series temporales
-        amplitudes = [chunk.amplitude for chunk in chunks]
-        brightnesses = [chunk.brightness for chunk in chunks]
-        beat_strengths = [chunk.beat_strength for chunk in chunks]
-        
-        # Calcular tendencias usando regresión lineal
-        x = np.arange(len(chunks))
+        # Calcular tendencias usando regresión lineal: amplitud, brightness, beat_strength y
+        # cada banda de frecuencia se ajustan a la vez con los estadísticos de la ventana
+        trends = self._calculate_trends(sweep, len(window))
         
-        amplitude_trend = self._calculate_trend(x, amplitudes)
-        brightness_trend = self._calculate_trend(x, brightnesses)
-        beat_strength_trend = self._calculate_trend(x, beat_strengths)
-        
-        # Tendencias por banda de frecuencia
-        frequency_trends = []
-        for i in range(len(chunks[0].frequencies)):
-            freq_series = [chunk.frequencies[i] for chunk in chunks]
-            trend = self._calculate_trend(x, freq_series)
-            frequency_trends.append(trend)
+        amplitude_trend, brightness_trend, beat_strength_trend = trends[:3].tolist()
+        frequency_trends = trends[3:].tolist()
         
         # Calcular métricas generales
-        overall_energy_trend = self._calculate_overall_energy_trend(chunks)
-        trend_strength = self._calculate_trend_strength(chunks)
-        volatility = self._calculate_volatility(chunks)
+        trend_strength = self._calculate_trend_strength(window.amplitude)
+        volatility = self._calculate_volatility(window.amplitude)
         
-        return TrendAnalysis(
+        return TrendAnalysis.model_construct(
             amplitude_trend=amplitude_trend,
             brightness_trend=brightness_trend,
             beat_strength_trend=beat_strength_trend,
             frequency_trends=frequency_trends,
-            overall_energy_trend=overall_energy_trend,
+            overall_energy_trend=energy_trend,
             trend_strength=trend_strength,
             volatility=volatility
         )
     
     def _analyze_patterns(self) -> PatternAnalysis:
         """Analiza patrones cíclicos en el buffer completo"""
-        if len(self.full_buffer) < 8:  # Necesitamos al menos 8 chunks para patrones
-            return PatternAnalysis(
-                detected_patterns=[],
-                pattern_strength=0.0,
-                cycle_length=None,
-                pattern_confidence=0.0
-            )
+        if self._count < 8:  # Necesitamos al menos 8 chunks para patrones
+            return self._default_pattern_analysis()
         
+        # Una sola detección (find_peaks) por análisis, compartida por las métricas
         detected_patterns = self._detect_cyclic_patterns()
-        pattern_strength = self._calculate_pattern_strength()
-        cycle_length = self._find_dominant_cycle_length()
-        pattern_confidence = self._calculate_pattern_confidence()
+        pattern_strength = self._calculate_pattern_strength(detected_patterns)
+        cycle_length = self._find_dominant_cycle_length(detected_patterns)
+        pattern_confidence = self._calculate_pattern_confidence(detected_patterns)
         
-        return PatternAnalysis(
+        return PatternAnalysis.model_construct(
             detected_patterns=detected_patterns,
             pattern_strength=pattern_strength,
             cycle_length=cycle_length,
             pattern_confidence=pattern_confidence
         )
     
-    def _make_predictions(self) -> PredictionAnalysis:
+    def _make_predictions(self, window: ChunkWindow, sweep: WindowSweep, energy_trend: float) -> PredictionAnalysis:
         """Hace predicciones basadas en las tendencias actuales"""
-        if len(self.window_buffer) < 3:
+        if len(window) < 3:
             return self._default_prediction_analysis()
         
-        chunks = list(self.window_buffer)
-        
         # Predicciones basadas en extrapolación de tendencias
-        predicted_amplitude = self._extrapolate_trend([c.amplitude for c in chunks])
-        predicted_brightness = self._extrapolate_trend([c.brightness for c in chunks])
-        predicted_beat_strength = self._extrapolate_trend([c.beat_strength for c in chunks])
+        predicted_amplitude, predicted_brightness, predicted_beat_strength = self._extrapolate_trends(sweep, len(window))
         
         # Predicción de cambio energético
-        predicted_energy_change = self._predict_energy_change(chunks)
+        predicted_energy_change = self._predict_energy_change(window)
         
         # Calcular probabilidades de eventos
-        drop_probability = self._calculate_drop_probability(chunks)
-        buildup_probability = self._calculate_buildup_probability(chunks)
-        break_probability = self._calculate_break_probability(chunks)
+        drop_probability = self._calculate_drop_probability(window, energy_trend)
+        buildup_probability = self._calculate_buildup_probability(window, energy_trend)
+        break_probability = self._calculate_break_probability(window, energy_trend)
         
-        return PredictionAnalysis(
+        return PredictionAnalysis.model_construct(
             predicted_amplitude=predicted_amplitude,
             predicted_brightness=predicted_brightness,
             predicted_beat_strength=predicted_beat_strength,
@@ -178,64 +351,75 @@ class AudioAnalyzer:
     
     # Métodos auxiliares
     
-    def _calculate_trend(self, x: np.ndarray, y: List[float]) -> float:
+    def _calculate_trend(self, y: np.ndarray) -> float:
         """Calcula la pendiente de regresión lineal normalizada"""
         if len(y) < 2:
             return 0.0
         
-        with warnings.catch_warnings():
-            warnings.simplefilter('ignore')
-            slope, _, r_value, _, _ = stats.linregress(x, y)
+        slope, _ = _ols(y)
         
         # Normalizar la pendiente considerando el rango de datos
-        y_range = max(y) - min(y)
+        y_range = y.max() - y.min()
         if y_range == 0:
             return 0.0
         
         # Normalizar entre -1 y 1
-        normalized_slope = np.clip(slope * len(x) / y_range, -1, 1)
+        normalized_slope = _clip(slope * len(y) / y_range, -1.0, 1.0)
         return float(normalized_slope)
     
-    def _calculate_transition_smoothness(self, chunks: List[AudioChunkData]) -> float:
+    def _sweep(self, window: ChunkWindow) -> WindowSweep:
+        """Rectas de mínimos cuadrados y rangos de todas las series de la ventana de análisis"""
+        # Mínimos cuadrados en forma cerrada: slope = (n·Σxy - Σx·Σy) / (n·Σx² - (Σx)²),
+        # con los estadísticos que se mantienen al añadir chunks
+        n = self._window_len
+        axis = _x_stats(n)
+        slopes = (n * self._sum_xy - axis.sum_x * self._sum_y) / axis.denom
+        intercepts = (self._sum_y - slopes * axis.sum_x) / n
+        
+        # Único recorrido de la ventana: rango de cada serie
+        y_range = window.series.max(axis=1) - window.series.min(axis=1)
+        return WindowSweep(slopes, intercepts, y_range)
+    
+    def _calculate_trends(self, sweep: WindowSweep, n: int) -> np.ndarray:
+        """Pendientes de regresión lineal normalizadas de todas las series de la ventana de análisis"""
+        # Normalizar la pendiente con el rango de cada serie, entre -1 y 1 (0 si la serie es constante)
+        normalized = np.zeros(len(sweep.y_range))
+        varying = sweep.y_range != 0
+        normalized[varying] = np.clip(sweep.slopes[varying] * n / sweep.y_range[varying], -1, 1)
+        return normalized
+    
+    def _calculate_transition_smoothness(self, amplitudes: List[float]) -> float:
         """Calcula qué tan suave es la transición"""
-        if len(chunks) < 2:
+        if len(amplitudes) < 2:
             return 1.0
         
         # Calcular varianza de los cambios consecutivos
-        changes = []
-        for i in range(1, len(chunks)):
-            change = abs(chunks[i].amplitude - chunks[i-1].amplitude)
-            changes.append(change)
-        
-        if not changes:
-            return 1.0
+        changes = [abs(curr - prev) for prev, curr in zip(amplitudes, amplitudes[1:])]
+        mean_change = sum(changes) / len(changes)
         
         # Menor varianza = más suave
-        variance = np.var(changes)
+        variance = sum((change - mean_change) * (change - mean_change) for change in changes) / len(changes)
         smoothness = 1.0 / (1.0 + variance * 10)  # Normalizar
-        return float(np.clip(smoothness, 0.0, 1.0))
+        return _clip(smoothness, 0.0, 1.0)
     
-    def _calculate_change_velocity(self, chunks: List[AudioChunkData]) -> float:
+    def _calculate_change_velocity(self, amplitudes: List[float]) -> float:
         """Calcula la velocidad del cambio"""
-        if len(chunks) < 3:
+        if len(amplitudes) < 3:
             return 0.0
         
         # Calcular aceleración (cambio de cambio)
-        velocities = []
-        for i in range(1, len(chunks) - 1):
-            prev_change = chunks[i].amplitude - chunks[i-1].amplitude
-            curr_change = chunks[i+1].amplitude - chunks[i].amplitude
-            acceleration = abs(curr_change - prev_change)
-            velocities.append(acceleration)
-        
-        return float(np.mean(velocities)) if velocities else 0.0
+        accelerations = [
+            abs((curr - prev) - (prev - before))
+            for before, prev, curr in zip(amplitudes, amplitudes[1:], amplitudes[2:])
+        ]
+        return sum(accelerations) / len(accelerations)
     
-    def _determine_energy_direction(self, chunks: List[AudioChunkData]) -> str:
+    def _determine_energy_direction(self, amplitudes: List[float]) -> str:
         """Determina la dirección del cambio energético"""
-        if len(chunks) < 2:
+        if len(amplitudes) < 2:
             return "stable"
         
-        recent_trend = chunks[-1].amplitude - chunks[0].amplitude
+        recent_trend = amplitudes[-1] - amplitudes[0]
         
         if recent_trend > 0.05:
             return "increasing"
@@ -244,65 +428,54 @@ class AudioAnalyzer:
         else:
             return "stable"
     
-    def _calculate_overall_energy_trend(self, chunks: List[AudioChunkData]) -> float:
+    def _calculate_overall_energy_trend(self, window: ChunkWindow) -> float:
         """Calcula tendencia energética general combinando múltiples métricas"""
-        if len(chunks) < 2:
+        if len(window) < 2:
             return 0.0
         
         # Combinar amplitud, brightness y beat_strength
-        energy_scores = []
-        for chunk in chunks:
-            energy = (chunk.amplitude + chunk.brightness + chunk.beat_strength) / 3.0
-            energy_scores.append(energy)
+        energy_scores = (window.amplitude + window.brightness + window.beat_strength) / 3.0
         
-        x = np.arange(len(energy_scores))
-        return self._calculate_trend(x, energy_scores)
+        return self._calculate_trend(energy_scores)
     
-    def _calculate_trend_strength(self, chunks: List[AudioChunkData]) -> float:
+    def _calculate_trend_strength(self, amplitudes: np.ndarray) -> float:
         """Calcula qué tan fuerte es la tendencia general"""
-        if len(chunks) < 3:
+        n = len(amplitudes)
+        if n < 3:
             return 0.0
         
-        amplitudes = [chunk.amplitude for chunk in chunks]
-        x = np.arange(len(amplitudes))
-        
-        with warnings.catch_warnings():
-            warnings.simplefilter('ignore')
-            _, _, r_value, _, _ = stats.linregress(x, amplitudes)
+        # |r| de la amplitud con sumas centradas, como linregress: Σy² - (Σy)²/n pierde toda la
+        # precisión por cancelación en ventanas de poca varianza (casi silencio)
+        x_centered = _x_stats(n).x - (n - 1) / 2
+        y_centered = amplitudes - amplitudes.mean()
+        ss_y = float(y_centered @ y_centered)
+        if ss_y == 0.0:  # Serie constante: sin tendencia
+            return 0.0
         
-        return float(abs(r_value)) if not np.isnan(r_value) else 0.0
+        r_value = float(x_centered @ y_centered) / np.sqrt(float(x_centered @ x_centered) * ss_y)
+        return float(min(abs(r_value), 1.0))
     
-    def _calculate_volatility(self, chunks: List[AudioChunkData]) -> float:
+    def _calculate_volatility(self, amplitudes: np.ndarray) -> float:
         """Calcula la volatilidad (variabilidad) de la música"""
-        if len(chunks) < 2:
+        if len(amplitudes) < 2:
             return 0.0
         
-        amplitudes = [chunk.amplitude for chunk in chunks]
+        # Desviación típica de la amplitud, recorriendo la ventana (sin cancelación de sumas)
         return float(np.std(amplitudes))
     
-    def _extrapolate_trend(self, values: List[float]) -> float:
-        """Extrapola una tendencia para predecir próximo valor"""
-        if len(values) < 2:
-            return values[0] if values else 0.0
-        
-        x = np.arange(len(values))
-        with warnings.catch_warnings():
-            warnings.simplefilter('ignore')
-            slope, intercept, _, _, _ = stats.linregress(x, values)
-        
-        # Predecir próximo valor
-        next_x = len(values)
-        predicted = slope * next_x + intercept
-        
-        return float(np.clip(predicted, 0.0, 1.0))
+    def _extrapolate_trends(self, sweep: WindowSweep, n: int) -> List[float]:
+        """Extrapola las tendencias de amplitud, brightness y beat_strength para predecir el próximo valor"""
+        # Predecir próximo valor (x = n) con la recta de cada serie
+        predicted = sweep.slopes[:3] * n + sweep.intercepts[:3]
+        return np.clip(predicted, 0.0, 1.0).tolist()
     
-    def _predict_energy_change(self, chunks: List[AudioChunkData]) -> str:
+    def _predict_energy_change(self, window: ChunkWindow) -> str:
         """Predice el tipo de cambio energético que viene"""
-        if len(chunks) < 5:
+        if len(window) < 5:
             return "stable"
         
-        recent_trend = self._calculate_overall_energy_trend(chunks[-5:])
-        current_energy = chunks[-1].amplitude
+        recent_trend = self._calculate_overall_energy_trend(window.tail(5))
+        current_energy = window.amplitude[-1]
         
         if recent_trend > 0.3 and current_energy > 0.7:
             return "drop"
@@ -313,16 +486,14 @@ class AudioAnalyzer:
         else:
             return "stable"
     
-    def _calculate_drop_probability(self, chunks: List[AudioChunkData]) -> float:
+    def _calculate_drop_probability(self, window: ChunkWindow, trend: float) -> float:
         """Calcula probabilidad de drop inminente"""
-        if len(chunks) < 5:
+        if len(window) < 5:
             return 0.0
         
         # Criterios: energía alta + tendencia creciente + beat fuerte
-        recent = chunks[-3:]
-        avg_amplitude = np.mean([c.amplitude for c in recent])
-        avg_beat = np.mean([c.beat_strength for c in recent])
-        trend = self._calculate_overall_energy_trend(chunks)
+        # Medias de los 3 últimos chunks de amplitud, brightness y beat_strength en una sola reducción
+        avg_amplitude, _, avg_beat = (window.series[:3, -3:].sum(axis=1) / 3).tolist()
         
         probability = 0.0
         if avg_amplitude > 0.7:
@@ -332,26 +503,24 @@ class AudioAnalyzer:
         if trend > 0.2:
             probability += 0.4
         
-        return float(np.clip(probability, 0.0, 1.0))
+        return _clip(probability, 0.0, 1.0)
     
-    def _calculate_buildup_probability(self, chunks: List[AudioChunkData]) -> float:
+    def _calculate_buildup_probability(self, window: ChunkWindow, trend: float) -> float:
         """Calcula probabilidad de buildup"""
-        if len(chunks) < 3:
+        if len(window) < 3:
             return 0.0
         
-        trend = self._calculate_overall_energy_trend(chunks)
-        return float(np.clip(trend, 0.0, 1.0))
+        return _clip(trend, 0.0, 1.0)
     
-    def _calculate_break_probability(self, chunks: List[AudioChunkData]) -> float:
+    def _calculate_break_probability(self, window: ChunkWindow, trend: float) -> float:
         """Calcula probabilidad de break/pausa"""
-        if len(chunks) < 3:
+        if len(window) < 3:
             return 0.0
         
-        recent_amplitude = chunks[-1].amplitude
-        trend = self._calculate_overall_energy_trend(chunks)
+        recent_amplitude = window.amplitude[-1]
         
         if recent_amplitude < 0.3 and trend < -0.1:
-            return float(np.clip(abs(trend), 0.0, 1.0))
+            return _clip(abs(trend), 0.0, 1.0)
         return 0.0
     
     # Métodos para análisis de patrones (implementación básica)
@@ -360,14 +529,14 @@ class AudioAnalyzer:
         """Detecta patrones cíclicos básicos"""
         patterns = []
         
-        if len(self.full_buffer) < 16:
+        if self._count < 16:
             return patterns
         
         # Buscar patrones en amplitud
-        amplitudes = [chunk.amplitude for chunk in self.full_buffer[-40:]]  # Últimos 8 segundos
+        amplitudes = self._window(self.pattern_window).amplitude  # Últimos 8 segundos
         
         # Buscar picos para detectar patrones rítmicos
-        peaks, _ = find_peaks(amplitudes, height=np.mean(amplitudes), distance=2)
+        peaks = _local_peaks(amplitudes, height=np.mean(amplitudes))
         
         if len(peaks) >= 3:
             # Calcular distancias entre picos
@@ -384,16 +553,14 @@ class AudioAnalyzer:
         
         return patterns
     
-    def _calculate_pattern_strength(self) -> float:
+    def _calculate_pattern_strength(self, patterns: List[Dict[str, Any]]) -> float:
         """Calcula la fuerza general de los patrones"""
-        patterns = self._detect_cyclic_patterns()
         if not patterns:
             return 0.0
         return float(np.mean([p.get("strength", 0.0) for p in patterns]))
     
-    def _find_dominant_cycle_length(self) -> Optional[int]:
+    def _find_dominant_cycle_length(self, patterns: List[Dict[str, Any]]) -> Optional[int]:
         """Encuentra la longitud del ciclo dominante"""
-        patterns = self._detect_cyclic_patterns()
         if not patterns:
             return None
         
@@ -402,9 +569,8 @@ class AudioAnalyzer:
         period_seconds = strongest.get("period", 0.0)
         return int(period_seconds / 0.2) if period_seconds > 0 else None
     
-    def _calculate_pattern_confidence(self) -> float:
+    def _calculate_pattern_confidence(self, patterns: List[Dict[str, Any]]) -> float:
         """Calcula confianza en la detección de patrones"""
-        patterns = self._detect_cyclic_patterns()
         if not patterns:
             return 0.0
         
@@ -413,39 +579,18 @@ class AudioAnalyzer:
         pattern_count = len(patterns)
         
         confidence = (strength_sum / max(pattern_count, 1)) * min(pattern_count / 3.0, 1.0)
-        return float(np.clip(confidence, 0.0, 1.0))
+        return _clip(float(confidence), 0.0, 1.0)
     
     # Métodos por defecto para casos con pocos datos
     
     def _default_transition_analysis(self) -> TransitionAnalysis:
-        return TransitionAnalysis(
-            amplitude_delta=0.0,
-            brightness_delta=0.0,
-            beat_strength_delta=0.0,
-            frequency_deltas=[0.0] * 20,
-            transition_smoothness=1.0,
-            change_velocity=0.0,
-            energy_direction="stable"
-        )
+        return _DEFAULT_TRANSITION
     
     def _default_trend_analysis(self) -> TrendAnalysis:
-        return TrendAnalysis(
-            amplitude_trend=0.0,
-            brightness_trend=0.0,
-            beat_strength_trend=0.0,
-            frequency_trends=[0.0] * 20,
-            overall_energy_trend=0.0,
-            trend_strength=0.0,
-            volatility=0.0
-        )
+        return _DEFAULT_TREND
+    
+    def _default_pattern_analysis(self) -> PatternAnalysis:
+        return _DEFAULT_PATTERN
     
     def _default_prediction_analysis(self) -> PredictionAnalysis:
-        return PredictionAnalysis(
-            predicted_amplitude=0.5,
-            predicted_brightness=0.5,
-            predicted_beat_strength=0.5,
-            predicted_energy_change="stable",
-            drop_probability=0.0,
-            buildup_probability=0.0,
-            break_probability=0.0
-        )
\ No newline at end of file
+        return _DEFAULT_PREDICTION
@@ -1,25 +1,67 @@
 import librosa
 import numpy as np
-from typing import List, Generator
+import os
+from typing import Dict
 import soundfile as sf
 import warnings
+from scipy.sparse import csr_matrix
 from typing import Tuple
-from models.models import AudioChunkData, AudioFileInfo # Se asume que models.models contiene la definición actualizada de AudioChunkData
+from models.models import N_BANDS, AudioChunkArrays, AudioFileInfo # Se asume que models.models contiene la definición actualizada de AudioChunkData
+
+try:
+    import torch  # Opcional: STFT en GPU/CPU con torch si está instalado
+except ImportError:
+    torch = None
+
+# Duración máxima que se procesa: el STFT de toda la pista vive entero en memoria
+# (unos 100 MB por minuto a 44.1 kHz entre espectro complejo, magnitud y características)
+MAX_AUDIO_DURATION_SECONDS = 15 * 60
+
+class AudioTooLongError(ValueError):
+    """El audio supera MAX_AUDIO_DURATION_SECONDS"""
 
 class AudioProcessor:
     def __init__(self, chunk_duration: float = 0.2):
         self.chunk_duration = chunk_duration  # Duración de cada chunk en segundos
         self.n_fft = 2048  # Tamaño de ventana para FFT (análisis de frecuencias)
         self.hop_length = 512  # Salto entre ventanas para análisis
-        self.n_frequency_bands = 20  # Número de bandas de frecuencia que extraemos
+        self.n_frequency_bands = N_BANDS  # Número de bandas de frecuencia que extraemos
+        self._band_matrices: Dict[int, csr_matrix] = {}  # {sample_rate: matriz de bandas}
+        self._chunk_samples: Dict[int, int] = {}  # {sample_rate: muestras por chunk}
+        
+        # Backend del STFT: torch (CUDA si hay GPU) o librosa como respaldo. El dispositivo y la
+        # ventana se eligen en el primer uso dentro de cada proceso (ver _torch_backend)
+        self.device = None
+        self._window = None
+        self._torch_pid: int | None = None  # Proceso en el que se crearon device y _window
+    
+    def _torch_backend(self) -> Tuple[str, "torch.Tensor"]:
+        """Dispositivo y ventana hann de torch para el proceso actual
+        
+        El procesador global se crea en el proceso del servidor, pero el STFT se hace en los
+        workers del pool: CUDA no puede inicializarse en el padre y usarse en un hijo.
+        """
+        if self._torch_pid != os.getpid():
+            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+            self._window = torch.hann_window(self.n_fft, device=self.device)
+            self._torch_pid = os.getpid()
+        return self.device, self._window
     
     def load_audio(self, file_path: str) -> Tuple[AudioFileInfo, np.ndarray, int | float]:
         """Carga el archivo de audio y extrae información básica"""
-        # Cargar audio con librosa (convierte automáticamente a mono si es estéreo)
-        y, sr = librosa.load(file_path, sr=None)  # sr=None preserva la frecuencia original
-        
-        # Obtener información del archivo usando soundfile
+        # Obtener información del archivo usando soundfile (solo la cabecera: se rechaza
+        # un audio demasiado largo antes de decodificarlo)
         info = sf.info(file_path)
+        if info.duration > MAX_AUDIO_DURATION_SECONDS:
+            raise AudioTooLongError(f"El audio supera la duración máxima de {MAX_AUDIO_DURATION_SECONDS // 60} minutos")
+        
+        # Decodificar directamente con soundfile a la frecuencia original (sin remuestreo)
+        y, sr = sf.read(file_path, dtype='float32', always_2d=False)
+        
+        # Convertir a mono si es estéreo
+        if y.ndim == 2:
+            y = y.mean(axis=1, dtype=np.float32)
+        y = np.ascontiguousarray(y, dtype=np.float32)  # float32 contiguo en todo el pipeline
         
         return AudioFileInfo(
             filename=file_path.split('/')[-1],
@@ -29,130 +71,160 @@ class AudioProcessor:
             file_path=file_path
         ), y, sr
     
-    def process_chunks(self, audio_data: np.ndarray, sample_rate: int) -> Generator[AudioChunkData, None, None]:
-        """Procesa el audio en chunks y genera los datos para visualización"""
+    def process_track(self, audio_data: np.ndarray, sample_rate: int) -> AudioChunkArrays:
+        """Procesa toda la pista y devuelve las características de todos sus chunks en columnas"""
         # Calcular número de muestras por chunk
-        chunk_samples = int(self.chunk_duration * sample_rate)
+        chunk_samples = self.chunk_samples_for(sample_rate)
         total_samples = len(audio_data)
         
-        # Procesar chunk por chunk
-        for i in range(0, total_samples, chunk_samples):
-            # Extraer el chunk actual
-            chunk = audio_data[i:i + chunk_samples]
-            
-            # Si el chunk es muy pequeño, rellenarlo con ceros
-            if len(chunk) < chunk_samples:
-                chunk = np.pad(chunk, (0, chunk_samples - len(chunk)))
-            
-            # Calcular timestamp del chunk
-            timestamp = i / sample_rate
-            
-            # Procesar el chunk y extraer características
-            chunk_data = self._analyze_chunk(chunk, sample_rate, timestamp)
-            
-            yield chunk_data
-    
-    def _analyze_chunk(self, chunk: np.ndarray, sample_rate: int, timestamp: float) -> AudioChunkData:
-        """Analiza un chunk individual y extrae todas las características"""
+        # Archivo decodificable pero sin muestras: no hay chunks (ni frames que reducir)
+        if total_samples == 0:
+            return AudioChunkArrays(0, n_bands=self.n_frequency_bands)
         
-        # 1. Calcular espectrograma usando STFT (Short-Time Fourier Transform)
-        stft = librosa.stft(chunk, n_fft=self.n_fft, hop_length=self.hop_length)
-        magnitude = np.abs(stft)  # Magnitud del espectrograma
+        # Calcular las características espectrales una sola vez sobre toda la pista
+        features = self._compute_track_features(audio_data, sample_rate)
+        n_frames = len(features["rms"])
         
-        # 2. Dividir el espectro en bandas de frecuencia
-        frequencies = self._extract_frequency_bands(magnitude, sample_rate)
+        # Primera muestra y primer frame del STFT global de cada chunk. Un chunk siempre abarca
+        # más de un hop, así que los frames del chunk k son [frame_starts[k], frame_ends[k])
+        sample_starts = np.arange(0, total_samples, chunk_samples)
+        frame_starts = sample_starts // self.hop_length
+        frame_ends = np.append(frame_starts[1:], n_frames)
         
-        # 3. Calcular amplitud general (RMS - Root Mean Square)
-        amplitude = librosa.feature.rms(y=chunk)[0, 0]  # Energía promedio del chunk
-        amplitude = float(np.clip(amplitude, 0, 1))  # Normalizar entre 0 y 1
+        # Reducir los frames de todos los chunks de una vez, directamente a las columnas (sin pasar por listas)
+        chunks = AudioChunkArrays(len(sample_starts), n_bands=self.n_frequency_bands)
+        chunks.timestamp[:] = sample_starts / sample_rate
+        for name, values in self._reduce_chunk_features(features, frame_starts, sample_rate).items():
+            getattr(chunks, name)[:] = values
+        chunks.energy_center[:] = chunks.rolloff # energy_center se mantiene como rolloff según la definición original
         
-        # 4. Calcular centroide espectral (brillo del sonido)
-        spectral_centroids = librosa.feature.spectral_centroid(y=chunk, sr=sample_rate)[0]
-        brightness = float(spectral_centroids[0] / (sample_rate / 2))  # Normalizar
+        # Nombres usados en cada iteración, resueltos una sola vez fuera del bucle
+        track_onset_env = features["onset_env"]
+        estimate_tempo = librosa.feature.tempo
+        hop_length = self.hop_length
+        tempo = chunks.tempo
         
-        # 5. Calcular rolloff espectral (dónde se concentra la energía)
-        rolloff = librosa.feature.spectral_rolloff(y=chunk, sr=sample_rate)[0, 0]
-        energy_center = float(rolloff) # energy_center se mantiene como rolloff según la definición original
+        for k, (frame_start, frame_end) in enumerate(zip(frame_starts.tolist(), frame_ends.tolist())):
+            # Calcular tempo (BPM) sobre la envolvente de onsets del chunk.
+            # La estimación del tempo en chunks muy cortos puede ser poco fiable.
+            # Solo se necesita el tempo, no las posiciones de los beats: se llama directamente
+            # al estimador que usa beat_track, sin su programación dinámica (0.0 si no hay onsets).
+            onset_env = track_onset_env[frame_start:frame_end]
+            if onset_env.any():
+                tempo[k] = estimate_tempo(onset_envelope=onset_env, sr=sample_rate, hop_length=hop_length, start_bpm=120)[0]
         
-        # 6. Detectar elementos percusivos usando onset detection
-        onset_frames = librosa.onset.onset_detect(y=chunk, sr=sample_rate, units='frames')
-        is_percussive = len(onset_frames) > 0  # Si hay onset, es percusivo
+        return chunks
+    
+    def _compute_track_features(self, audio_data: np.ndarray, sample_rate: int) -> Dict[str, np.ndarray]:
+        """Calcula por frame todas las características basadas en el STFT de la pista completa"""
+        # Espectrograma de magnitud de toda la pista (un único STFT)
+        magnitude = self._stft_magnitude(audio_data)
         
-        # 7. Calcular zero crossing rate (para detectar ruido vs tonos)
-        zcr = librosa.feature.zero_crossing_rate(chunk)[0, 0]
-        zero_crossing_rate = float(zcr)
-
-        # 8. Calcular planitud espectral (spectral_flatness)
-        # S=magnitude es el espectrograma de magnitud
-        spectral_flatness_val = librosa.feature.spectral_flatness(S=magnitude)[0, 0]
-        spectral_flatness = float(spectral_flatness_val)
-
-        # 9. Calcular características de croma (chroma_features)
-        # Se promedia a través de los frames de tiempo para obtener un único valor por chunk
         with warnings.catch_warnings():
             warnings.simplefilter('ignore', UserWarning)
             chroma = librosa.feature.chroma_stft(S=magnitude, sr=sample_rate, n_fft=self.n_fft, hop_length=self.hop_length)
-        chroma_features = [float(val) for val in np.mean(chroma, axis=1)]
-
-        # 10. Calcular fuerza del beat (beat_strength)
-        # Primero, se calcula la envolvente de la fuerza de inicio (onset strength)
-        onset_env = librosa.onset.onset_strength(y=chunk, sr=sample_rate)
-        # La fuerza del beat para un chunk puede ser el valor máximo de su envolvente de inicio
-        beat_strength = float(np.max(onset_env)) if onset_env.size > 0 else 0.0
+        
+        # Envolvente de onsets de toda la pista y máscara de frames con onset detectado. Se parte del
+        # mismo STFT (espectrograma mel en dB, igual que onset_strength desde la señal) en lugar de calcular otro
+        mel_db = librosa.power_to_db(librosa.feature.melspectrogram(S=magnitude ** 2, sr=sample_rate))
+        onset_env = librosa.onset.onset_strength(S=mel_db, sr=sample_rate, hop_length=self.hop_length)
+        onset_frames = librosa.onset.onset_detect(onset_envelope=onset_env, sr=sample_rate, hop_length=self.hop_length, units='frames')
+        onset_mask = np.zeros(len(onset_env), dtype=bool)
+        onset_mask[onset_frames] = True
+        
+        return {
+            # Energía promedio por banda de frecuencia y frame (un único producto disperso)
+            "bands": self._band_matrix_for(sample_rate) @ magnitude,
+            # RMS sobre la señal para conservar la escala del análisis por chunk
+            "rms": librosa.feature.rms(y=audio_data, frame_length=self.n_fft, hop_length=self.hop_length)[0],
+            "centroid": librosa.feature.spectral_centroid(S=magnitude, sr=sample_rate, n_fft=self.n_fft, hop_length=self.hop_length)[0],
+            "rolloff": librosa.feature.spectral_rolloff(S=magnitude, sr=sample_rate, n_fft=self.n_fft, hop_length=self.hop_length)[0],
+            "zcr": librosa.feature.zero_crossing_rate(audio_data, frame_length=self.n_fft, hop_length=self.hop_length)[0],
+            "flatness": librosa.feature.spectral_flatness(S=magnitude)[0],
+            "chroma": chroma,
+            "onset_env": onset_env,
+            "onset_mask": onset_mask,
+        }
+    
+    def _stft_magnitude(self, audio_data: np.ndarray) -> np.ndarray:
+        """Espectrograma de magnitud de toda la pista, con torch si está disponible"""
+        if torch is None:
+            stft = librosa.stft(audio_data, n_fft=self.n_fft, hop_length=self.hop_length)
+            return np.abs(stft).astype(np.float32, copy=False)
+        
+        # Mismos parámetros que librosa.stft: ventana hann, centrado y relleno con ceros
+        device, window = self._torch_backend()
+        y = torch.from_numpy(np.ascontiguousarray(audio_data)).to(device)
+        stft = torch.stft(y, n_fft=self.n_fft, hop_length=self.hop_length, window=window,
+                          center=True, pad_mode='constant', return_complex=True)
+        return stft.abs().cpu().numpy().astype(np.float32, copy=False)
+    
+    def _reduce_chunk_features(self, features: Dict[str, np.ndarray], frame_starts: np.ndarray,
+                               sample_rate: int) -> Dict[str, np.ndarray]:
+        """Reduce los frames de cada chunk a sus características, para todos los chunks a la vez"""
+        counts = np.diff(np.append(frame_starts, features["rms"].shape[-1])).astype(np.float32)
+        
+        def chunk_mean(values: np.ndarray) -> np.ndarray:
+            # Media de los frames de cada chunk sobre el último eje: [..., frames] -> [..., chunks]
+            return np.add.reduceat(values, frame_starts, axis=-1) / counts
+        
+        # 1-2. Energía de las bandas de frecuencia, normalizada entre 0 y 1 en cada chunk
+        band_energies = chunk_mean(features["bands"])
+        max_energy = band_energies.max(axis=0)
+        frequencies = np.divide(band_energies, max_energy, out=band_energies.copy(), where=max_energy > 0)
+        
+        return {
+            "frequencies": frequencies.T,
+            # 3. Amplitud general (RMS - Root Mean Square), normalizada entre 0 y 1
+            "amplitude": np.clip(chunk_mean(features["rms"]), 0, 1),
+            # 4. Centroide espectral normalizado (brillo del sonido)
+            "brightness": chunk_mean(features["centroid"]) / (sample_rate / 2),
+            # 5. Rolloff espectral (dónde se concentra la energía)
+            "rolloff": chunk_mean(features["rolloff"]),
+            # 6. Elementos percusivos: si hay algún onset en el chunk, es percusivo
+            "is_percussive": np.logical_or.reduceat(features["onset_mask"], frame_starts),
+            # 7. Zero crossing rate (para detectar ruido vs tonos)
+            "zero_crossing_rate": chunk_mean(features["zcr"]),
+            # 8. Planitud espectral (spectral_flatness)
+            "spectral_flatness": chunk_mean(features["flatness"]),
+            # 9. Croma: promedio de cada una de las 12 notas en los frames del chunk
+            "chroma_features": chunk_mean(features["chroma"]).T,
+            # 10. Fuerza del beat: valor máximo de la envolvente de onsets del chunk
+            "beat_strength": np.maximum.reduceat(features["onset_env"], frame_starts),
+        }
+    
+    def chunk_samples_for(self, sample_rate: int) -> int:
+        """Muestras por chunk para esta frecuencia de muestreo, memorizadas por instancia"""
+        if sample_rate not in self._chunk_samples:
+            self._chunk_samples[sample_rate] = int(self.chunk_duration * sample_rate)
+        return self._chunk_samples[sample_rate]
+    
+    def _band_matrix_for(self, sample_rate: int) -> csr_matrix:
+        """Matriz de bandas para esta frecuencia de muestreo, memorizada por instancia"""
+        if sample_rate not in self._band_matrices:
+            self._band_matrices[sample_rate] = _precompute_band_matrix(sample_rate, self.n_fft, self.n_frequency_bands)
+        return self._band_matrices[sample_rate]
 
-        # 11. Calcular tempo (BPM)
-        # La estimación del tempo en chunks muy cortos puede ser poco fiable.
-        # librosa.beat.beat_track devuelve un array, tomamos el primer elemento.
-        # Requiere una envolvente de inicio.
-        tempo_val, _ = librosa.beat.beat_track(onset_envelope=onset_env, sr=sample_rate, start_bpm=120)
-        tempo = float(tempo_val) if tempo_val is not None else 0.0
 
-        return AudioChunkData(
-            timestamp=timestamp,
-            frequencies=frequencies,
-            amplitude=amplitude,
-            brightness=brightness,
-            energy_center=energy_center,
-            is_percussive=is_percussive,
-            rolloff=float(rolloff),
-            zero_crossing_rate=zero_crossing_rate,
-            spectral_flatness=spectral_flatness,
-            chroma_features=chroma_features,
-            beat_strength=beat_strength,
-            tempo=tempo
-        )
+def _precompute_band_matrix(sample_rate: int, n_fft: int, n_bands: int) -> csr_matrix:
+    """Matriz dispersa [n_bands, 1 + n_fft // 2] que promedia los bins del FFT de cada banda"""
+    # Crear límites de frecuencia logarítmicos (más resolución en graves)
+    freq_bins = np.logspace(np.log10(20), np.log10(sample_rate/2), n_bands + 1)
+    
+    # Convertir frecuencias a índices del espectrograma
+    fft_freqs = librosa.fft_frequencies(sr=sample_rate, n_fft=n_fft)
+    low_bins = np.searchsorted(fft_freqs, freq_bins[:-1])
+    high_bins = np.searchsorted(fft_freqs, freq_bins[1:])
+    
+    # Si no encontró el límite superior, usar el último bin
+    high_bins[high_bins >= len(fft_freqs)] = len(fft_freqs) - 1
+    
+    rows, cols, values = [], [], []
+    for band, (low_bin, high_bin) in enumerate(zip(low_bins, high_bins)):
+        # Las bandas vacías quedan como filas de ceros (energía 0.0)
+        if high_bin > low_bin:
+            rows.extend([band] * (high_bin - low_bin))
+            cols.extend(range(low_bin, high_bin))
+            values.extend([1.0 / (high_bin - low_bin)] * (high_bin - low_bin))
     
-    def _extract_frequency_bands(self, magnitude: np.ndarray, sample_rate: int) -> List[float]:
-        """Divide el espectro en bandas de frecuencia y calcula la energía de cada banda"""
-        # Crear límites de frecuencia logarítmicos (más resolución en graves)
-        freq_bins = np.logspace(np.log10(20), np.log10(sample_rate/2), self.n_frequency_bands + 1)
-        
-        # Convertir frecuencias a índices del espectrograma
-        fft_freqs = librosa.fft_frequencies(sr=sample_rate, n_fft=self.n_fft)
-        
-        band_energies = []
-        
-        for i in range(self.n_frequency_bands):
-            # Encontrar índices correspondientes a esta banda
-            low_freq = freq_bins[i]
-            high_freq = freq_bins[i + 1]
-            
-            # Encontrar bins del FFT que caen en esta banda
-            low_bin = np.argmax(fft_freqs >= low_freq)
-            high_bin = np.argmax(fft_freqs >= high_freq)
-            
-            if high_bin == 0:  # Si no encontró, usar el último bin
-                high_bin = len(fft_freqs) - 1
-            
-            # Calcular energía promedio en esta banda
-            band_magnitude = magnitude[low_bin:high_bin, :]
-            if band_magnitude.size > 0:
-                energy = float(np.mean(band_magnitude))
-            else:
-                energy = 0.0
-            
-            band_energies.append(energy)
-        
-        # Normalizar las energías para que estén entre 0 y 1
-        max_energy = max(band_energies) if max(band_energies) > 0 else 1
-        return [energy / max_energy for energy in band_energies]
+    return csr_matrix((values, (rows, cols)), shape=(n_bands, len(fft_freqs)), dtype=np.float32)
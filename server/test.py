@@ -1,7 +1,7 @@
 import httpx
 import asyncio
 import websockets
-import json
+import orjson
 import os
 from pprint import pprint # Para imprimir datos JSON de forma legible
 
@@ -81,12 +81,13 @@ async def receive_chunks_from_websocket(session_id: str):
     print(f"Conectando a {ws_url}...")
     
     try:
-        async with websockets.connect(ws_url) as websocket:
+        # Sin compresión ni límite de tamaño: el cliente de prueba no debe ser el cuello de botella
+        async with websockets.connect(ws_url, compression=None, max_size=None) as websocket:
             print("Conexión WebSocket establecida. Recibiendo datos...")
             processed_chunks_count = 0
             while True:
                 message = await websocket.recv()
-                message_json = json.loads(message)
+                message_json = orjson.loads(message)
                 
                 message_type = message_json.get("type")
                 message_data = message_json.get("data")